@@ -14,6 +14,7 @@ import os
 import json
 import shutil
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 def create_edge_impulse_structure():
     """
@@ -26,8 +27,8 @@ def create_edge_impulse_structure():
         'edge_impulse_data/testing/no_plate'
     ]
     
-    for folder in folders:
-        Path(folder).mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda folder: Path(folder).mkdir(parents=True, exist_ok=True), folders))
     
     print("Edge Impulse data folders created!")
     print("\nFolder structure:")
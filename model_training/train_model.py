@@ -4,70 +4,663 @@ This script creates a lightweight TFLite model suitable for ESP32-CAM
 
 Requirements:
 pip install tensorflow numpy pillow matplotlib scikit-learn
+pip install tflite  # optional, for EON-style export
+pip install tensorflow-model-optimization  # optional, for weight pruning
+
+TensorFlow is imported lazily, so converting an existing model needs only numpy:
+python train_model.py --convert-only lpr_model.tflite
 """
 
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras import layers
 import numpy as np
+import argparse
+import hashlib
+import importlib.util
+import math
+import mmap
+import os
 import pathlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 # Model configuration for ESP32-CAM constraints
 INPUT_SHAPE = (96, 96, 1)  # Grayscale 96x96
 NUM_CLASSES = 2  # Binary: license_plate_present / no_license_plate
+WIDTH_MULTIPLIER = 0.5  # MobileNet-style alpha applied to every conv
+
+# Input sizes x width multipliers exported by --sweep
+SWEEP_INPUT_SIZES = (64, 96, 128)
+SWEEP_WIDTH_MULTIPLIERS = (0.25, 0.5, 1.0)
+
+# Converted .tflite / generated C sources, keyed by content hash
+# Bump CACHE_VERSION whenever the converter setup or the C generators
+# change, so stale entries are not reused
+CACHE_DIR = pathlib.Path('.cache') / 'lpr'
+CACHE_VERSION = 4
+
+# Dataset layout shared with edge_impulse_setup.py:
+#   edge_impulse_data/{training,testing}/{license_plate,no_plate}/*.jpg
+DATASET_DIR = 'edge_impulse_data'
+CLASS_NAMES = ['license_plate', 'no_plate']
+
+# Epochs when training on images from DATASET_DIR
+EPOCHS = 30
+
+# Images used for INT8 post-training quantization calibration
+NUM_CAL_SAMPLES = 200
+
+# TFLiteConverter setup (names in tf.lite.Optimize / tf.lite.OpsSet);
+# part of the .tflite cache key
+CONVERTER_SETTINGS = {
+    'optimizations': ('DEFAULT',),
+    'supported_ops': ('TFLITE_BUILTINS_INT8',),
+    'io_type': 'int8',
+    'num_cal_samples': NUM_CAL_SAMPLES,
+}
+
+# Training-time augmentation
+AUGMENT_SEED = 42
+MAX_ROTATION = 0.1  # radians (~6 degrees)
+
+# Fraction of weights zeroed by magnitude pruning; it is reached after
+# PRUNING_END_FRACTION of the training steps, in about PRUNING_UPDATES
+# mask updates, and the remaining steps fine-tune the pruned weights
+PRUNING_FINAL_SPARSITY = 0.5
+PRUNING_END_FRACTION = 0.7
+PRUNING_UPDATES = 10
+
+# Training steps used to initialize the untrained example model
+INIT_STEPS = 10
+
+# Builtin ops the exported graph may use (all have esp-tflite-micro kernels)
+TFLM_SUPPORTED_OPS = {
+    'CONV_2D', 'DEPTHWISE_CONV_2D', 'FULLY_CONNECTED', 'SOFTMAX',
+    'MAX_POOL_2D', 'AVERAGE_POOL_2D', 'ADD', 'MEAN', 'RESHAPE', 'QUANTIZE',
+}
+
+# Byte width of each TFLite tensor type (see tflite.TensorType)
+TENSOR_TYPE_BYTES = {
+    0: 4,   # FLOAT32
+    1: 2,   # FLOAT16
+    2: 4,   # INT32
+    3: 1,   # UINT8
+    4: 8,   # INT64
+    6: 1,   # BOOL
+    7: 2,   # INT16
+    9: 1,   # INT8
+}
+
+# Weight tensors above this size are left in flash/PSRAM by the EON-style export
+LARGE_WEIGHT_BYTES = 32 * 1024
+
+# Kernel entry point emitted for each builtin op in EON-style export
+EON_KERNELS = {
+    'CONV_2D': 'EvalConv',
+    'DEPTHWISE_CONV_2D': 'EvalDepthwiseConv',
+    'FULLY_CONNECTED': 'EvalFullyConnected',
+    'MAX_POOL_2D': 'EvalMaxPool',
+    'AVERAGE_POOL_2D': 'EvalAveragePool',
+    'MEAN': 'EvalMean',
+    'SOFTMAX': 'EvalSoftmax',
+    'RESHAPE': 'EvalReshape',
+    'QUANTIZE': 'EvalQuantize',
+    'DEQUANTIZE': 'EvalDequantize',
+    'ADD': 'EvalAdd',
+}
+
+# Op options table for each builtin op the EON-style export understands
+EON_OPTIONS = {
+    'CONV_2D': 'Conv2DOptions',
+    'DEPTHWISE_CONV_2D': 'DepthwiseConv2DOptions',
+    'FULLY_CONNECTED': 'FullyConnectedOptions',
+    'MAX_POOL_2D': 'Pool2DOptions',
+    'AVERAGE_POOL_2D': 'Pool2DOptions',
+    'SOFTMAX': 'SoftmaxOptions',
+    'ADD': 'AddOptions',
+    'MEAN': 'ReducerOptions',
+}
+
+# Parameter block shared by every generated kernel call
+EON_PARAMS_STRUCT = """\
+// Everything a kernel needs, resolved from the flatbuffer at export time
+struct TensorShape {
+  int32_t rank;
+  int32_t dims[4];
+};
+
+struct OpParams {
+  int32_t num_inputs;
+  const TensorShape* input_shapes;  // one per input, rank 0 when absent
+  TensorShape output_shape;
+  // Conv / depthwise / pooling geometry (SAME padding already resolved)
+  int32_t stride_width, stride_height;
+  int32_t dilation_width, dilation_height;
+  int32_t filter_width, filter_height;
+  int32_t pad_width, pad_height;
+  int32_t depth_multiplier;
+  // Quantization of input 0 and the output: real = scale * (q - zero_point)
+  float input_scale;
+  int32_t input_zero_point;
+  float output_scale;
+  int32_t output_zero_point;
+  // int8 clamp implementing the fused activation
+  int32_t activation_min, activation_max;
+  // Per-channel requantization of input_scale * filter_scale[c] / output_scale
+  // as a Q31 multiplier and power-of-two shift (TFLM QuantizeMultiplier)
+  int32_t num_channels;
+  const int32_t* output_multiplier;
+  const int32_t* output_shift;
+  float beta;         // SOFTMAX
+  int32_t keep_dims;  // MEAN
+};
+
+"""
+
+def parse_and_decode(path, input_shape=INPUT_SHAPE):
+    """
+    Load one JPEG as a normalized grayscale model input
+    Label is the index of the parent folder name in CLASS_NAMES;
+    a folder that is not in CLASS_NAMES fails the pipeline
+    """
+    import tensorflow as tf
+    
+    image = tf.io.decode_jpeg(tf.io.read_file(path), channels=1)
+    image = tf.image.resize(image, input_shape[:2])
+    image = tf.cast(image, tf.float32) / 127.5 - 1.0  # [-1, 1]
+    
+    class_name = tf.strings.split(path, os.sep)[-2]
+    matches = tf.equal(CLASS_NAMES, class_name)
+    tf.debugging.assert_equal(tf.reduce_any(matches), True,
+                              message="image folder is not one of CLASS_NAMES")
+    label = tf.argmax(tf.cast(matches, tf.int32))
+    
+    return image, label
+
+def _rotate(image, angle):
+    """
+    Rotate an HxWxC image about its center (same transform as keras RandomRotation)
+    """
+    import tensorflow as tf
+    
+    height = tf.cast(tf.shape(image)[0], tf.float32)
+    width = tf.cast(tf.shape(image)[1], tf.float32)
+    cos, sin = tf.cos(angle), tf.sin(angle)
+    x_offset = ((width - 1) - (cos * (width - 1) - sin * (height - 1))) / 2.0
+    y_offset = ((height - 1) - (sin * (width - 1) + cos * (height - 1))) / 2.0
+    transform = tf.stack([cos, -sin, x_offset, sin, cos, y_offset, 0.0, 0.0])
+    
+    rotated = tf.raw_ops.ImageProjectiveTransformV3(
+        images=image[None],
+        transforms=transform[None],
+        output_shape=tf.shape(image)[:2],
+        fill_value=0.0,
+        interpolation='BILINEAR',
+        fill_mode='REFLECT',
+    )
+    return rotated[0]
+
+def _augment_seeds(value):
+    """
+    Expand one random int64 into the (2, 5) stateless seeds augment() uses
+    """
+    import tensorflow as tf
+    
+    base = tf.stack([value, tf.constant(0, tf.int64)])
+    return tf.stack([tf.random.experimental.stateless_fold_in(base, i) for i in range(5)], axis=1)
+
+def augment(image, label, seeds):
+    """
+    Random flip, brightness, contrast, pad+crop and small rotation
+    Pure tf.image graph ops so augmentation runs inside the tf.data map;
+    seeds is a (2, 5) tensor of stateless seeds, one column per op
+    """
+    import tensorflow as tf
+    
+    image = tf.image.stateless_random_flip_left_right(image, seeds[:, 0])
+    image = tf.image.stateless_random_brightness(image, 0.2, seeds[:, 1])
+    image = tf.image.stateless_random_contrast(image, 0.8, 1.2, seeds[:, 2])
+    
+    # Random translation: pad by 8 pixels and crop back to input size
+    height, width, channels = image.shape
+    padded = tf.image.resize_with_crop_or_pad(image, height + 8, width + 8)
+    image = tf.image.stateless_random_crop(padded, (height, width, channels), seeds[:, 3])
+    
+    angle = tf.random.stateless_uniform([], seeds[:, 4], -MAX_ROTATION, MAX_ROTATION)
+    image = _rotate(image, angle)
+    
+    return tf.clip_by_value(image, -1.0, 1.0), label
+
+def _has_images(image_root):
+    """
+    True when any CLASS_NAMES folder under image_root contains a JPEG
+    """
+    root = pathlib.Path(image_root)
+    return any(any((root / class_name).glob('*.jpg')) for class_name in CLASS_NAMES)
+
+def build_dataset(image_root, batch_size=32, training=True, seed=AUGMENT_SEED,
+                  input_shape=INPUT_SHAPE, cache_file=None):
+    """
+    Streaming tf.data input pipeline over a class-per-folder image tree
+    Decoding runs in parallel and is overlapped with training via prefetch
+    Decoded images are cached after the first epoch: in RAM by default
+    (4 bytes per pixel, ~36 KB per 96x96 image), or on disk under
+    cache_file when the dataset is too large for memory. A cache_file is
+    not invalidated when the images or input_shape change; delete it then
+    With training=True, images are augmented after the cache so every
+    epoch sees new (but seed-reproducible) variants
+    """
+    import tensorflow as tf
+    
+    root = pathlib.Path(image_root)
+    unknown = sorted(p.name for p in root.iterdir() if p.is_dir() and p.name not in CLASS_NAMES)
+    if unknown:
+        print(f"NOTE: ignoring folders not in CLASS_NAMES under {root}: {', '.join(unknown)}")
+    
+    # Only list the known class folders, so every image gets a real label
+    patterns = [str(root / class_name / '*.jpg') for class_name in CLASS_NAMES]
+    dataset = tf.data.Dataset.list_files(patterns, shuffle=False)
+    dataset = dataset.map(lambda path: parse_and_decode(path, input_shape),
+                          num_parallel_calls=tf.data.AUTOTUNE)
+    if cache_file is not None:
+        pathlib.Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+        dataset = dataset.cache(str(cache_file))
+    else:
+        dataset = dataset.cache()
+    if training:
+        dataset = dataset.shuffle(2048, seed=seed)
+        
+        # Per-element seeds come from a seeded random stream zipped with the
+        # images, so the seed an image gets never depends on map thread
+        # scheduling; the stream re-randomizes (deterministically) per epoch
+        seed_stream = tf.data.Dataset.random(seed=seed, rerandomize_each_iteration=True)
+        dataset = tf.data.Dataset.zip((dataset, seed_stream))
+        dataset = dataset.map(
+            lambda element, value: augment(*element, _augment_seeds(value)),
+            num_parallel_calls=tf.data.AUTOTUNE)
+    
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+def build_calibration_dataset(image_root, num_samples=NUM_CAL_SAMPLES, input_shape=INPUT_SHAPE):
+    """
+    Class-stratified PTQ calibration set as a tf.data pipeline
+    JPEG decode/resize runs in parallel and is prefetched, overlapping
+    preprocessing with the converter's calibration passes
+    Yields batches of one image, as the converter expects
+    """
+    import tensorflow as tf
+    
+    rng = np.random.default_rng(AUGMENT_SEED)
+    paths = []
+    for class_name in CLASS_NAMES:
+        class_paths = sorted(str(p) for p in (pathlib.Path(image_root) / class_name).glob('*.jpg'))
+        rng.shuffle(class_paths)
+        paths += class_paths[:num_samples // len(CLASS_NAMES)]
+    
+    dataset = tf.data.Dataset.from_tensor_slices(tf.constant(paths, dtype=tf.string))
+    dataset = dataset.map(lambda path: parse_and_decode(path, input_shape)[0],
+                          num_parallel_calls=tf.data.AUTOTUNE)
+    
+    return dataset.batch(1).prefetch(tf.data.AUTOTUNE)
+
+def depthwise_separable_block(filters):
+    """
+    DepthwiseConv2D -> BN -> ReLU6 -> 1x1 Conv2D -> BN -> ReLU6
+    """
+    from tensorflow.keras import layers
+    
+    return [
+        layers.DepthwiseConv2D(3, padding='same', use_bias=False),
+        layers.BatchNormalization(),
+        layers.ReLU(max_value=6),
+        layers.Conv2D(filters, 1, padding='same', use_bias=False),
+        layers.BatchNormalization(),
+        layers.ReLU(max_value=6),
+    ]
 
-def create_lightweight_model(input_shape, num_classes):
+def create_lightweight_model(input_shape=INPUT_SHAPE, num_classes=NUM_CLASSES,
+                             width_multiplier=WIDTH_MULTIPLIER):
     """
     Creates a MobileNetV2-inspired lightweight model for ESP32-CAM
     Target model size: < 300KB
+    width_multiplier scales every conv's filter count (MobileNet's alpha)
     """
+    from tensorflow import keras
+    from tensorflow.keras import layers
+    
+    def filters(count):
+        return max(1, int(count * width_multiplier))
+    
     model = keras.Sequential([
         # Input layer
         layers.Input(shape=input_shape),
         
         # First convolution block
-        layers.Conv2D(16, 3, strides=2, padding='same', activation='relu'),
+        # (Conv -> BN -> ReLU6 so BatchNorm can be folded into the conv at export;
+        # ReLU6 keeps activation ranges tight for int8 calibration)
+        layers.Conv2D(filters(16), 3, strides=2, padding='same', use_bias=False),
         layers.BatchNormalization(),
+        layers.ReLU(max_value=6),
         
-        # Depthwise separable convolutions (MobileNet style)
-        layers.SeparableConv2D(32, 3, padding='same', activation='relu'),
-        layers.BatchNormalization(),
+        # Depthwise separable convolutions (MobileNet style), written as
+        # explicit DepthwiseConv2D + 1x1 Conv2D so both map onto ESP-NN's
+        # optimized int8 depthwise / conv kernels
+        *depthwise_separable_block(filters(32)),
         layers.MaxPooling2D(2),
         
-        layers.SeparableConv2D(64, 3, padding='same', activation='relu'),
-        layers.BatchNormalization(),
+        *depthwise_separable_block(filters(64)),
         layers.MaxPooling2D(2),
         
-        layers.SeparableConv2D(128, 3, padding='same', activation='relu'),
-        layers.BatchNormalization(),
+        *depthwise_separable_block(filters(128)),
         layers.MaxPooling2D(2),
         
-        # Global pooling and classifier
+        # Classifier head as 1x1 convs before global pooling, so it runs on
+        # ESP-NN's conv kernels instead of FullyConnected. Not the same math
+        # as pooling then Dense: the ReLU is applied at every spatial
+        # position before averaging, and the Dense MACs are repeated at every
+        # position (36x at 6x6). SpatialDropout2D is dropped from the TFLite graph
+        layers.SpatialDropout2D(0.2),
+        layers.Conv2D(filters(64), 1, activation='relu'),
+        layers.SpatialDropout2D(0.2),
+        layers.Conv2D(num_classes, 1),
         layers.GlobalAveragePooling2D(),
-        layers.Dropout(0.2),
-        layers.Dense(64, activation='relu'),
-        layers.Dropout(0.2),
-        layers.Dense(num_classes, activation='softmax')
+        layers.Softmax()
     ])
     
     return model
 
-def convert_to_tflite(model, model_path='lpr_model.tflite'):
+def _import_tfmot():
+    """
+    Returns (tfmot, None) when magnitude pruning can run here, otherwise
+    (None, reason). tfmot only wraps Keras 2 (tf_keras) models, so it is
+    unusable when tf.keras is Keras 3 (TF >= 2.16 without TF_USE_LEGACY_KERAS)
+    """
+    try:
+        import tensorflow_model_optimization as tfmot
+    except ImportError:
+        return None, "pip install tensorflow-model-optimization to enable pruning"
+    
+    import tensorflow as tf
+    if getattr(tf.keras, '__version__', '2').startswith('3'):
+        return None, ("pruning needs Keras 2: pip install tf_keras and set "
+                      "TF_USE_LEGACY_KERAS=1 to enable it")
+    return tfmot, None
+
+def prune_model(model, num_steps, final_sparsity=PRUNING_FINAL_SPARSITY):
+    """
+    Wrap model for magnitude-based weight pruning (tensorflow_model_optimization)
+    num_steps is the total number of training batches (at least 2); sparsity
+    ramps from 0 to final_sparsity over the first PRUNING_END_FRACTION of
+    them, leaving the rest to recover accuracy
+    Returns (pruned_model, callbacks); pass the callbacks to model.fit and
+    call strip_pruning() on the result before export
+    """
+    tfmot, reason = _import_tfmot()
+    if tfmot is None:
+        print(f"NOTE: {reason}")
+        return model, []
+    
+    # Masks are only updated every `frequency` steps, so end on a multiple
+    # of it, early enough that several updates ramp the sparsity up and the
+    # pruned weights still get fine-tuned before training stops
+    target_end = max(1, int(num_steps * PRUNING_END_FRACTION))
+    frequency = max(1, min(100, target_end // PRUNING_UPDATES))
+    end_step = target_end // frequency * frequency
+    
+    schedule = tfmot.sparsity.keras.PolynomialDecay(
+        initial_sparsity=0.0,
+        final_sparsity=final_sparsity,
+        begin_step=0,
+        end_step=end_step,
+        frequency=frequency,
+    )
+    pruned = tfmot.sparsity.keras.prune_low_magnitude(model, pruning_schedule=schedule)
+    pruned.compile(
+        optimizer='adam',
+        loss='sparse_categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    
+    return pruned, [tfmot.sparsity.keras.UpdatePruningStep()]
+
+def strip_pruning(model):
+    """
+    Remove pruning wrappers, keeping the pruned (zeroed) weights
+    """
+    tfmot, _ = _import_tfmot()
+    if tfmot is None:
+        return model
+    return tfmot.sparsity.keras.strip_pruning(model)
+
+def _fold_conv_bn(conv, bn):
+    """
+    Fold a BatchNormalization layer into the preceding conv layer
+    Returns (layer_class, config, weights) for the folded conv
+    """
+    from tensorflow.keras import layers
+    
+    mean = bn.moving_mean.numpy()
+    variance = bn.moving_variance.numpy()
+    gamma = bn.gamma.numpy() if bn.scale else np.ones_like(mean)
+    beta = bn.beta.numpy() if bn.center else np.zeros_like(mean)
+    factor = gamma / np.sqrt(variance + bn.epsilon)
+    
+    weights = conv.get_weights()
+    bias = weights.pop() if conv.use_bias else np.zeros_like(mean)
+    
+    if isinstance(conv, layers.DepthwiseConv2D):
+        # Output channel c * multiplier + m lives at kernel[..., c, m]
+        weights[-1] = weights[-1] * factor.reshape(weights[-1].shape[2:])
+    else:
+        # Output channels are the last axis of the kernel
+        # (the pointwise 1x1 kernel for SeparableConv2D)
+        weights[-1] = weights[-1] * factor
+    weights.append((bias - mean) * factor + beta)
+    
+    config = conv.get_config()
+    config['use_bias'] = True
+    
+    return conv.__class__, config, weights
+
+def fold_batchnorm(model):
     """
-    Convert Keras model to quantized TFLite for ESP32-CAM
-    Uses INT8 quantization for minimal size
+    Fold every Conv2D/DepthwiseConv2D/SeparableConv2D -> BatchNormalization pair into a
+    single conv with adjusted weights and bias
+    Removes the BN ops (and their activation tensors) from the exported graph
     """
+    from tensorflow import keras
+    from tensorflow.keras import layers
+    
+    source_layers = list(model.layers)
+    specs = []
+    folded_count = 0
+    
+    i = 0
+    while i < len(source_layers):
+        layer = source_layers[i]
+        next_layer = source_layers[i + 1] if i + 1 < len(source_layers) else None
+        
+        if (isinstance(layer, (layers.Conv2D, layers.DepthwiseConv2D, layers.SeparableConv2D))
+                and isinstance(next_layer, layers.BatchNormalization)
+                and layer.get_config()['activation'] == 'linear'):
+            specs.append(_fold_conv_bn(layer, next_layer))
+            folded_count += 1
+            i += 2
+        else:
+            specs.append((layer.__class__, layer.get_config(), layer.get_weights()))
+            i += 1
+    
+    folded = keras.Sequential(
+        [layers.Input(shape=model.input_shape[1:])] +
+        [layer_class.from_config(config) for layer_class, config, _ in specs]
+    )
+    for layer, (_, _, weights) in zip(folded.layers, specs):
+        layer.set_weights(weights)
+    
+    print(f"Folded {folded_count} BatchNormalization layers into conv weights")
+    
+    return folded
+
+def _model_fingerprint(model):
+    """
+    sha256 of the model architecture and weights, the cache version, the
+    converter settings and the TensorFlow version, used as the conversion
+    cache key
+    """
+    import tensorflow as tf
+    
+    digest = hashlib.sha256(model.to_json().encode())
+    for weights in model.get_weights():
+        digest.update(weights.tobytes())
+    digest.update(f'v{CACHE_VERSION} tf{tf.__version__} '
+                  f'{sorted(CONVERTER_SETTINGS.items())}'.encode())
+    return digest.hexdigest()
+
+def _run_converter(model, representative_data):
+    """
+    Run the TFLiteConverter with full INT8 post-training quantization
+    """
+    import tensorflow as tf
+    
     # Create converter
     converter = tf.lite.TFLiteConverter.from_keras_model(model)
     
     # Apply optimizations
-    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    # (no EXPERIMENTAL_SPARSITY: TFLM refuses sparse-encoded tensors, so
+    # pruned weights are exported dense and only shrink once compressed)
+    converter.optimizations = [getattr(tf.lite.Optimize, name)
+                               for name in CONVERTER_SETTINGS['optimizations']]
+    
+    # Calibrate activation ranges with real samples, fed through tf.data
+    # so preprocessing overlaps with calibration
+    if callable(representative_data) or hasattr(representative_data, '__next__'):
+        # Generator (or generator function) of single samples; a plain
+        # generator can only be consumed once, which is all conversion needs
+        samples = representative_data
+        generator = samples if callable(samples) else (lambda: samples)
+        representative_data = tf.data.Dataset.from_generator(
+            generator,
+            output_signature=tf.TensorSpec(model.input_shape[1:], tf.float32)).batch(1)
+    elif not isinstance(representative_data, tf.data.Dataset):
+        samples = np.asarray(representative_data, dtype=np.float32)
+        representative_data = tf.data.Dataset.from_tensor_slices(samples).batch(1)
+    
+    def representative_dataset():
+        for batch in representative_data.take(CONVERTER_SETTINGS['num_cal_samples']):
+            yield [batch.numpy()]
     
-    # INT8 quantization (smallest size)
-    converter.target_spec.supported_types = [tf.int8]
+    converter.representative_dataset = representative_dataset
+    
+    # Full integer quantization (int8 ops, int8 input/output)
+    converter.target_spec.supported_ops = [getattr(tf.lite.OpsSet, name)
+                                           for name in CONVERTER_SETTINGS['supported_ops']]
+    converter.inference_input_type = tf.as_dtype(CONVERTER_SETTINGS['io_type'])
+    converter.inference_output_type = tf.as_dtype(CONVERTER_SETTINGS['io_type'])
     
     # Convert
-    tflite_model = converter.convert()
+    return converter.convert()
+
+def _flatbuffer_ops(model_data):
+    """
+    Builtin op names and sparse-encoded tensor names of the main subgraph,
+    read from the flatbuffer. Returns None when the tflite schema package
+    is not installed
+    """
+    try:
+        import tflite
+    except ImportError:
+        return None
+    
+    model = tflite.Model.GetRootAsModel(model_data, 0)
+    subgraph = model.Subgraphs(0)
+    
+    op_names = set()
+    for i in range(subgraph.OperatorsLength()):
+        opcode = model.OperatorCodes(subgraph.Operators(i).OpcodeIndex())
+        op_names.add(tflite.opcode2name(max(opcode.BuiltinCode(),
+                                            opcode.DeprecatedBuiltinCode())))
+    sparse_tensors = [subgraph.Tensors(t).Name().decode()
+                      for t in range(subgraph.TensorsLength())
+                      if subgraph.Tensors(t).Sparsity() is not None]
+    return op_names, sparse_tensors
+
+def validate_tflite_model(tflite_model):
+    """
+    Pre-flight check before flashing: load the model with the reference
+    kernels, reject ops and sparse-encoded tensors that TFLM on the ESP32
+    can't run, report the tensor arena and run one inference on random
+    int8 input
+    Raises ValueError for unsupported ops or sparse tensors
+    """
+    import tensorflow as tf
+    
+    interpreter = tf.lite.Interpreter(
+        model_content=tflite_model,
+        experimental_op_resolver_type=tf.lite.experimental.OpResolverType.BUILTIN_REF)
+    interpreter.allocate_tensors()
+    
+    flatbuffer_ops = _flatbuffer_ops(tflite_model)
+    if flatbuffer_ops is not None:
+        op_names, sparse_tensors = flatbuffer_ops
+    elif hasattr(interpreter, '_get_ops_details'):
+        # Private API, only used when the schema package is missing
+        op_names = {op['op_name'] for op in interpreter._get_ops_details()}
+        sparse_tensors = []
+    else:
+        print("NOTE: pip install tflite to check the model's ops against TFLM")
+        op_names, sparse_tensors = set(), []
+    
+    if sparse_tensors:
+        raise ValueError("Model has sparse-encoded tensors, which ESP32 TFLM can't load: "
+                         f"{', '.join(sparse_tensors)}")
+    # (DENSIFY, emitted for sparse weights, is not in TFLM_SUPPORTED_OPS either)
+    unsupported = sorted(op_names - TFLM_SUPPORTED_OPS)
+    if unsupported:
+        raise ValueError(f"Model uses ops not supported on ESP32 TFLM: {', '.join(unsupported)}")
+    
+    if op_names:
+        print(f"Validated ops: {', '.join(sorted(op_names))}")
+    arena_size = _arena_size_estimate(tflite_model)
+    if arena_size is not None:
+        print(f"Planned tensor arena: {arena_size / 1024:.2f} KB "
+              "(activations + 10% headroom, as in lpr_model_arena_size)")
+    else:
+        tensor_bytes = sum(int(np.prod(t['shape'])) * np.dtype(t['dtype']).itemsize
+                           for t in interpreter.get_tensor_details())
+        print(f"Total tensor memory (weights + activations): {tensor_bytes / 1024:.2f} KB")
+    
+    input_details = interpreter.get_input_details()[0]
+    random_input = np.random.randint(-128, 128, size=input_details['shape'], dtype=np.int8)
+    interpreter.set_tensor(input_details['index'], random_input)
+    interpreter.invoke()
+
+def convert_to_tflite(model, model_path='lpr_model.tflite', representative_data=None,
+                      force=False):
+    """
+    Convert Keras model to fully quantized INT8 TFLite for ESP32-CAM
+    Weights AND activations are int8, so every op can run on the
+    ESP-NN / CMSIS-NN optimized kernels instead of float reference kernels.
+
+    representative_data: ~100-400 calibration samples, as an array shaped
+    like the model input, e.g. (N, 96, 96, 1); a generator (or a function
+    returning one) yielding single samples, e.g. (96, 96, 1); or a
+    tf.data.Dataset yielding batches of one (see build_calibration_dataset)
+    
+    Results are cached under .cache/lpr/ keyed on the model's architecture
+    and weights, CONVERTER_SETTINGS and the TensorFlow version (not the
+    calibration data); force=True always reconverts
+    Fresh conversions are checked with validate_tflite_model() first
+    """
+    if representative_data is None:
+        raise ValueError("representative_data is required for full INT8 quantization")
+    
+    cache_path = CACHE_DIR / f'{_model_fingerprint(model)}.tflite'
+    if cache_path.exists() and not force:
+        print(f"Using cached TFLite model {cache_path}")
+        tflite_model = cache_path.read_bytes()
+    else:
+        tflite_model = _run_converter(model, representative_data)
+        validate_tflite_model(tflite_model)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_bytes(tflite_model)
     
     # Save
     with open(model_path, 'wb') as f:
@@ -78,39 +671,527 @@ def convert_to_tflite(model, model_path='lpr_model.tflite'):
     
     return tflite_model
 
-def tflite_to_c_array(tflite_path, output_path='lpr_model.h'):
+def verify_tflite_model(tflite_model, model, samples):
     """
-    Convert TFLite model to C array for Arduino
+    Run the quantized model in the TFLite interpreter and check that its
+    argmax predictions match the Keras model on a held-out batch
+    Returns the fraction of matching predictions
     """
-    with open(tflite_path, 'rb') as f:
-        model_data = f.read()
+    import tensorflow as tf
+    
+    samples = np.asarray(samples, dtype=np.float32)
+    
+    interpreter = tf.lite.Interpreter(model_content=tflite_model)
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()[0]
+    output_details = interpreter.get_output_details()[0]
+    input_scale, input_zero_point = input_details['quantization']
+    
+    tflite_preds = []
+    for sample in samples:
+        quantized = np.round(sample / input_scale + input_zero_point)
+        quantized = np.clip(quantized, -128, 127).astype(np.int8)
+        interpreter.set_tensor(input_details['index'], quantized[None])
+        interpreter.invoke()
+        tflite_preds.append(np.argmax(interpreter.get_tensor(output_details['index'])[0]))
+    
+    keras_preds = np.argmax(model.predict(samples, verbose=0), axis=-1)
+    agreement = float(np.mean(np.array(tflite_preds) == keras_preds))
+    
+    print(f"TFLite/Keras argmax agreement: {agreement * 100:.1f}% "
+          f"({len(samples)} samples)")
+    if agreement < 1.0:
+        print("WARNING: Quantized model predictions differ from Keras model")
+    
+    return agreement
+
+def _hex_lines(data):
+    """
+    Format raw bytes as C initializer lines, 12 bytes per line
+    One C-level hex() call for the whole buffer ('aa bb cc ...', 3 chars
+    per byte), then per-line slicing and str.replace, so large models
+    avoid a per-byte f-string
+    """
+    spaced = memoryview(data).hex(' ')
+    return ''.join(
+        '  0x' + spaced[i:i + 35].replace(' ', ', 0x') + ',\n'
+        for i in range(0, len(spaced), 36)
+    )
+
+def _align(value, alignment=16):
+    return (value + alignment - 1) // alignment * alignment
+
+def _plan_arena(sizes, lifetimes, alignment=16):
+    """
+    Greedy first-fit arena planner (same idea as TFLM's GreedyMemoryPlanner)
+    Largest tensors are placed first; tensors whose lifetimes overlap
+    never share bytes. Returns (offsets, arena_size)
+    """
+    offsets = {}
+    for tensor in sorted(sizes, key=lambda t: sizes[t], reverse=True):
+        first, last = lifetimes[tensor]
+        conflicts = sorted(
+            (offsets[other], offsets[other] + sizes[other])
+            for other in offsets
+            if lifetimes[other][0] <= last and first <= lifetimes[other][1]
+        )
+        offset = 0
+        for start, end in conflicts:
+            if offset + sizes[tensor] <= start:
+                break
+            offset = max(offset, _align(end, alignment))
+        offsets[tensor] = offset
+    
+    arena_size = max((offsets[t] + sizes[t] for t in offsets), default=0)
+    return offsets, _align(arena_size, alignment)
+
+def _tensor_bytes(tensor):
+    """
+    Size in bytes of a flatbuffer tensor
+    """
+    num_elements = int(np.prod(tensor.ShapeAsNumpy())) if tensor.ShapeLength() else 1
+    return num_elements * TENSOR_TYPE_BYTES.get(tensor.Type(), 4)
+
+def _plan_activations(model, subgraph):
+    """
+    Split a subgraph's tensors into constant weights and arena-resident
+    activations, and place the activations with _plan_arena using their
+    lifetimes in operator order
+    Returns (weights, offsets, arena_size); weights maps tensor index to
+    its bytes, offsets maps activation tensor index to its arena offset
+    """
+    num_ops = subgraph.OperatorsLength()
+    
+    weights = {}
+    sizes = {}
+    for t in range(subgraph.TensorsLength()):
+        tensor = subgraph.Tensors(t)
+        buffer = model.Buffers(tensor.Buffer())
+        if buffer.DataLength() > 0:
+            weights[t] = buffer.DataAsNumpy().tobytes()
+        else:
+            sizes[t] = _tensor_bytes(tensor)
+    
+    # Activation lifetimes in operator order
+    lifetimes = {}
+    for t in subgraph.InputsAsNumpy():
+        lifetimes[int(t)] = (0, 0)
+    for k in range(num_ops):
+        op = subgraph.Operators(k)
+        for t in list(op.InputsAsNumpy()) + list(op.OutputsAsNumpy()):
+            t = int(t)
+            if t in sizes:
+                first, last = lifetimes.get(t, (k, k))
+                lifetimes[t] = (min(first, k), max(last, k))
+    for t in subgraph.OutputsAsNumpy():
+        first, _ = lifetimes[int(t)]
+        lifetimes[int(t)] = (first, num_ops - 1)
+    
+    sizes = {t: size for t, size in sizes.items() if t in lifetimes}
+    offsets, arena_size = _plan_arena(sizes, lifetimes)
+    return weights, offsets, arena_size
+
+def _arena_size_estimate(model_data):
+    """
+    TFLM tensor arena size: the planned activation arena (tensors with
+    disjoint lifetimes share bytes, as in TFLM's planner) plus 10% headroom
+    for interpreter bookkeeping. Returns None when the tflite schema
+    package is not installed
+    """
+    try:
+        import tflite
+    except ImportError:
+        return None
+    
+    model = tflite.Model.GetRootAsModel(model_data, 0)
+    _, _, arena_size = _plan_activations(model, model.Subgraphs(0))
+    return _align(int(arena_size * 1.1))
+
+def _quantization_constants(model_data):
+    """
+    C++ constants for the int8 input/output quantization of the model,
+    read from the flatbuffer so the ESP32 never has to do float math on
+    the input. Returns '' when the tflite schema package is not installed
+    """
+    try:
+        import tflite
+    except ImportError:
+        print("NOTE: pip install tflite to emit kInputScale/kInputZp constants")
+        return ''
+    
+    model = tflite.Model.GetRootAsModel(model_data, 0)
+    subgraph = model.Subgraphs(0)
+    
+    def scale_and_zero_point(t):
+        quantization = subgraph.Tensors(int(t)).Quantization()
+        if quantization is None or quantization.ScaleLength() == 0:
+            return 1.0, 0
+        return float(quantization.Scale(0)), int(quantization.ZeroPoint(0))
+    
+    input_scale, input_zp = scale_and_zero_point(subgraph.InputsAsNumpy()[0])
+    output_scale, output_zp = scale_and_zero_point(subgraph.OutputsAsNumpy()[0])
+    
+    header = '// int8 quantization parameters: real = scale * (q - zero_point)\n'
+    # Pixels normalized to [-1, 1] (x = pixel / 127.5 - 1) quantize with
+    # scale 2/255 and zero point -1 or 0, i.e. q = pixel - 128 to within one
+    # step; only offer the integer shortcut when calibration produced that
+    if math.isclose(input_scale, 2 / 255, rel_tol=0.01) and input_zp in (-1, 0):
+        header += (
+            '//\n'
+            '// The input scale is ~1/127.5 (pixels normalized to [-1, 1]), so a\n'
+            '// PIXFORMAT_GRAYSCALE uint8 pixel maps to the int8 input with a\n'
+            '// single integer op, no floats:\n'
+            '//   input[i] = (int8_t)(pixel[i] - 128);   // == pixel ^ 0x80\n'
+            '// Otherwise quantize with: q = round(x / kInputScale) + kInputZp\n'
+        )
+    else:
+        header += '// Quantize the input with: q = round(x / kInputScale) + kInputZp\n'
+    
+    return header + (
+        f'constexpr float kInputScale = {input_scale!r}f;\n'
+        f'constexpr int kInputZp = {input_zp};\n'
+        f'constexpr float kOutputScale = {output_scale!r}f;\n'
+        f'constexpr int kOutputZp = {output_zp};\n\n'
+    )
+
+def _quantize_multiplier(real_multiplier):
+    """
+    Split a real multiplier into a Q31 fixed-point value and a shift,
+    exactly like TFLM's QuantizeMultiplier
+    """
+    if real_multiplier == 0.0:
+        return 0, 0
+    significand, shift = math.frexp(real_multiplier)
+    quantized = int(round(significand * (1 << 31)))
+    if quantized == 1 << 31:
+        quantized //= 2
+        shift += 1
+    if shift < -31:
+        return 0, 0
+    return quantized, shift
+
+def _activation_range(activation, scale, zero_point):
+    """
+    int8 clamp bounds for a fused activation (TFLM CalculateActivationRangeQuantized)
+    """
+    qmin, qmax = -128, 127
+    
+    def quantize(x):
+        return zero_point + int(round(x / scale))
+    
+    if activation == 1:    # RELU
+        return max(qmin, zero_point), qmax
+    if activation == 2:    # RELU_N1_TO_1
+        return max(qmin, quantize(-1.0)), min(qmax, quantize(1.0))
+    if activation == 3:    # RELU6
+        return max(qmin, zero_point), min(qmax, quantize(6.0))
+    return qmin, qmax
+
+def _eon_op_params(tflite, subgraph, op, op_name, k):
+    """
+    C++ definitions of kOp<k>: the OpParams for one operator, with its
+    options, tensor shapes and requantization tables
+    """
+    def shape_of(t):
+        if t < 0:
+            return '{0, {0, 0, 0, 0}}'
+        dims = [int(d) for d in subgraph.Tensors(t).ShapeAsNumpy()] if subgraph.Tensors(t).ShapeLength() else []
+        if len(dims) > 4:
+            raise ValueError(f"op {k} ({op_name}): tensors above rank 4 are not supported")
+        padded = dims + [0] * (4 - len(dims))
+        return f'{{{len(dims)}, {{{", ".join(map(str, padded))}}}}}'
+    
+    def quantization_of(t):
+        quantization = subgraph.Tensors(t).Quantization()
+        if quantization is None or quantization.ScaleLength() == 0:
+            return [1.0], [0]
+        return ([float(x) for x in quantization.ScaleAsNumpy()],
+                [int(x) for x in quantization.ZeroPointAsNumpy()])
+    
+    inputs = [int(t) for t in op.InputsAsNumpy()]
+    output = int(op.OutputsAsNumpy()[0])
+    input_scale, input_zp = quantization_of(inputs[0])
+    output_scale, output_zp = quantization_of(output)
+    input_scale, input_zp = input_scale[0], input_zp[0]
+    output_scale, output_zp = output_scale[0], output_zp[0]
+    
+    # Read the builtin options table for this op
+    options = None
+    options_table = op.BuiltinOptions()
+    if op_name in EON_OPTIONS and options_table is not None:
+        options = getattr(tflite, EON_OPTIONS[op_name])()
+        options.Init(options_table.Bytes, options_table.Pos)
+    
+    def option(name, default):
+        return getattr(options, name)() if options is not None and hasattr(options, name) else default
+    
+    stride_w, stride_h = option('StrideW', 1), option('StrideH', 1)
+    dilation_w, dilation_h = option('DilationWFactor', 1), option('DilationHFactor', 1)
+    filter_w, filter_h = option('FilterWidth', 1), option('FilterHeight', 1)
+    if op_name in ('CONV_2D', 'DEPTHWISE_CONV_2D'):
+        filter_shape = subgraph.Tensors(inputs[1]).ShapeAsNumpy()
+        filter_h, filter_w = int(filter_shape[1]), int(filter_shape[2])
+    
+    # Resolve SAME padding the way TFLM's ComputePaddingHeightWidth does
+    pad_w = pad_h = 0
+    if option('Padding', 1) == 0 and op_name in ('CONV_2D', 'DEPTHWISE_CONV_2D',
+                                                  'MAX_POOL_2D', 'AVERAGE_POOL_2D'):
+        in_shape = subgraph.Tensors(inputs[0]).ShapeAsNumpy()
+        out_shape = subgraph.Tensors(output).ShapeAsNumpy()
+        
+        def padding(in_size, out_size, stride, dilation, filter_size):
+            effective_filter = (filter_size - 1) * dilation + 1
+            return max(0, (int(out_size) - 1) * stride + effective_filter - int(in_size)) // 2
+        
+        pad_h = padding(in_shape[1], out_shape[1], stride_h, dilation_h, filter_h)
+        pad_w = padding(in_shape[2], out_shape[2], stride_w, dilation_w, filter_w)
+    
+    activation_min, activation_max = _activation_range(
+        option('FusedActivationFunction', 0), output_scale, output_zp)
+    
+    lines = [f'// op {k}: {op_name}\n',
+             f'static const TensorShape kOp{k}InputShapes[] = '
+             f'{{{", ".join(shape_of(t) for t in inputs)}}};\n']
+    
+    multiplier_ref = shift_ref = 'nullptr'
+    num_channels = 0
+    if op_name in ('CONV_2D', 'DEPTHWISE_CONV_2D', 'FULLY_CONNECTED'):
+        filter_scales, _ = quantization_of(inputs[1])
+        requant = [_quantize_multiplier(input_scale * scale / output_scale) for scale in filter_scales]
+        num_channels = len(requant)
+        multiplier_ref, shift_ref = f'kOp{k}Multiplier', f'kOp{k}Shift'
+        lines.append(f'static const int32_t {multiplier_ref}[] = '
+                     f'{{{", ".join(str(m) for m, _ in requant)}}};\n')
+        lines.append(f'static const int32_t {shift_ref}[] = '
+                     f'{{{", ".join(str(sh) for _, sh in requant)}}};\n')
+    
+    fields = [
+        len(inputs), f'kOp{k}InputShapes', shape_of(output),
+        stride_w, stride_h, dilation_w, dilation_h, filter_w, filter_h, pad_w, pad_h,
+        option('DepthMultiplier', 1),
+        f'{input_scale!r}f', input_zp, f'{output_scale!r}f', output_zp,
+        activation_min, activation_max,
+        num_channels, multiplier_ref, shift_ref,
+        f'{float(option("Beta", 1.0))!r}f', int(bool(option('KeepDims', False))),
+    ]
+    lines.append(f'static const OpParams kOp{k} = {{{", ".join(str(x) for x in fields)}}};\n\n')
+    
+    return ''.join(lines)
+
+def _write_eon_source(model_data, output_path):
+    """
+    EON-compiler-style export: instead of embedding the flatbuffer for the
+    TFLM interpreter, emit C++ that calls one kernel per op in execution
+    order against a statically planned tensor arena. Each call gets a
+    static OpParams with the op's options, shapes and requantization
+    Requires: pip install tflite
+    """
+    try:
+        import tflite
+    except ImportError:
+        raise ImportError("EON-style export needs the flatbuffer schema: pip install tflite")
+    
+    model = tflite.Model.GetRootAsModel(model_data, 0)
+    subgraph = model.Subgraphs(0)
+    num_ops = subgraph.OperatorsLength()
+    
+    weights, offsets, arena_size = _plan_activations(model, subgraph)
+    
+    def tensor_ref(t):
+        if t < 0:
+            return 'nullptr'
+        if t in weights:
+            return f'weights_t{t}'
+        return f'tensor_arena + {offsets[t]}'
+    
+    calls = []
+    params = []
+    kernels = set()
+    for k in range(num_ops):
+        op = subgraph.Operators(k)
+        opcode = model.OperatorCodes(op.OpcodeIndex())
+        builtin = max(opcode.BuiltinCode(), opcode.DeprecatedBuiltinCode())
+        op_name = tflite.opcode2name(builtin)
+        kernel = EON_KERNELS.get(
+            op_name, 'Eval' + ''.join(part.capitalize() for part in op_name.split('_')))
+        kernels.add(kernel)
+        
+        params.append(_eon_op_params(tflite, subgraph, op, op_name, k))
+        
+        inputs = ', '.join(tensor_ref(int(t)) for t in op.InputsAsNumpy())
+        output = tensor_ref(int(op.OutputsAsNumpy()[0]))
+        calls.append(f'  // op {k}: {op_name}\n'
+                     f'  {{\n'
+                     f'    const void* in[] = {{{inputs}}};\n'
+                     f'    {kernel}(kOp{k}, in, {output});\n'
+                     f'  }}\n')
+    
+    input_tensor = int(subgraph.InputsAsNumpy()[0])
+    output_tensor = int(subgraph.OutputsAsNumpy()[0])
     
-    # Generate C header file
     with open(output_path, 'w') as f:
-        f.write('#ifndef LPR_MODEL_H\n')
-        f.write('#define LPR_MODEL_H\n\n')
-        f.write('const unsigned char lpr_model[] = {\n')
+        f.write('// EON-style export generated by train_model.py - do not edit\n')
+        f.write('// Kernels are called directly; no TFLM interpreter is linked.\n\n')
+        f.write('#include <stddef.h>\n')
+        f.write('#include <stdint.h>\n')
+        f.write('#include <esp_attr.h>\n\n')
+        f.write('namespace lpr_model {\n\n')
+        
+        f.write(_quantization_constants(model_data))
+        f.write(f'constexpr size_t kArenaSize = {arena_size};\n')
+        f.write('alignas(16) static uint8_t tensor_arena[kArenaSize];\n\n')
         
-        # Write bytes in hex format
-        for i in range(0, len(model_data), 12):
-            chunk = model_data[i:i+12]
-            hex_values = ', '.join([f'0x{b:02x}' for b in chunk])
-            f.write(f'  {hex_values},\n')
+        # One array per weight tensor so each can be placed on its own:
+        # small tensors are copied to internal DRAM at boot, large ones stay
+        # in flash .rodata (moved to PSRAM when built with CONFIG_SPIRAM_RODATA)
+        f.write('#ifndef LPR_SMALL_WEIGHT_ATTR\n')
+        f.write('#define LPR_SMALL_WEIGHT_ATTR DRAM_ATTR\n')
+        f.write('#endif\n')
+        f.write('#ifndef LPR_LARGE_WEIGHT_ATTR\n')
+        f.write('#define LPR_LARGE_WEIGHT_ATTR\n')
+        f.write('#endif\n\n')
+        for t, data in weights.items():
+            attr = 'LPR_LARGE_WEIGHT_ATTR' if len(data) > LARGE_WEIGHT_BYTES else 'LPR_SMALL_WEIGHT_ATTR'
+            f.write(f'// {subgraph.Tensors(t).Name().decode()} ({len(data)} bytes)\n')
+            f.write(f'alignas(16) static const uint8_t {attr} weights_t{t}[] = {{\n')
+            f.write(_hex_lines(data))
+            f.write('};\n\n')
         
-        f.write('};\n\n')
-        f.write(f'const unsigned int lpr_model_len = {len(model_data)};\n\n')
-        f.write('#endif // LPR_MODEL_H\n')
+        # Per-op parameters, so kernels need no flatbuffer at runtime
+        f.write(EON_PARAMS_STRUCT)
+        f.write(''.join(params))
+        
+        # Signature: (op parameters, inputs, output)
+        for kernel in sorted(kernels):
+            f.write(f'extern void {kernel}(const OpParams& params, '
+                    f'const void* const* inputs, void* output);\n')
+        f.write('\n')
+        
+        f.write(f'int8_t* input() {{ return reinterpret_cast<int8_t*>({tensor_ref(input_tensor)}); }}\n')
+        f.write(f'int8_t* output() {{ return reinterpret_cast<int8_t*>({tensor_ref(output_tensor)}); }}\n\n')
+        
+        f.write('void invoke() {\n')
+        f.write(''.join(calls))
+        f.write('}\n\n')
+        f.write('}  // namespace lpr_model\n')
     
-    print(f"C array saved to {output_path}")
+    print(f"EON-style source saved to {output_path}")
+    print(f"Tensor arena: {arena_size / 1024:.2f} KB, {num_ops} ops, "
+          f"{len(weights)} weight arrays")
 
-def main():
-    print("Creating lightweight LPR model for ESP32-CAM...")
+def tflite_to_c_array(tflite_path, output_path='lpr_model.h', eon=False, force=False):
+    """
+    Convert TFLite model to C array for Arduino
+    With eon=True, emit an EON-style .cc (direct kernel calls, static
+    arena, per-tensor weight arrays) instead of the flatbuffer blob
+    Output is cached under .cache/lpr/ keyed on the .tflite contents,
+    CACHE_VERSION and whether the tflite schema package is installed
+    (it adds the quantization and arena constants); force=True always
+    regenerates
+    """
+    # Memory-map the model instead of reading it into a bytes copy;
+    # numpy and the flatbuffer parser index the mapping directly.
+    # The mapping is left to the garbage collector rather than closed in a
+    # with block: numpy views kept alive by a traceback would turn any
+    # error into "BufferError: cannot close exported pointers exist"
+    with open(tflite_path, 'rb') as f:
+        model_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _write_c_source(model_data, output_path, eon, force)
+
+def _write_c_source(model_data, output_path, eon, force):
+    """
+    Write (or restore from cache) the C source for an in-memory model
+    """
+    if eon:
+        output_path = pathlib.Path(output_path).with_suffix('.cc')
     
-    # Create model
-    model = create_lightweight_model(INPUT_SHAPE, NUM_CLASSES)
+    digest = hashlib.sha256(model_data)
+    has_schema = importlib.util.find_spec('tflite') is not None
+    digest.update(f'v{CACHE_VERSION} schema={has_schema}'.encode())
+    cache_path = (CACHE_DIR / f'{digest.hexdigest()}{"-eon" if eon else ""}'
+                              f'{pathlib.Path(output_path).suffix}')
+    if cache_path.exists() and not force:
+        shutil.copyfile(cache_path, output_path)
+        print(f"Using cached C source {cache_path}")
+        print(f"C array saved to {output_path}")
+        return
     
-    # Display model summary
-    model.summary()
+    if eon:
+        _write_eon_source(model_data, str(output_path))
+    else:
+        # Generate C header file
+        arena_size = _arena_size_estimate(model_data)
+        header = (
+            '#ifndef LPR_MODEL_H\n'
+            '#define LPR_MODEL_H\n\n'
+            '// Generated by train_model.py from a '
+            f'{len(model_data)}-byte TFLite flatbuffer.\n'
+            '// lpr_model is 16-byte aligned so ESP-NN can use aligned vector\n'
+            '// loads; the static_assert below checks the array was not truncated.\n'
+            '//\n'
+            '// Define LPR_MODEL_ATTR before including this header to change where\n'
+            '// the model lives (defaults to internal DRAM; define it empty to keep\n'
+            '// the model in flash .rodata when DRAM is short).\n\n'
+            '#include <esp_attr.h>\n\n'
+            '#ifndef LPR_MODEL_ATTR\n'
+            '#define LPR_MODEL_ATTR DRAM_ATTR\n'
+            '#endif\n\n'
+            + _quantization_constants(model_data) +
+            'alignas(16) const unsigned char LPR_MODEL_ATTR lpr_model[] = {\n'
+            + _hex_lines(model_data) +
+            '};\n\n'
+            f'const unsigned int lpr_model_len = {len(model_data)};\n'
+            'static_assert(sizeof(lpr_model) == lpr_model_len, '
+            '"lpr_model does not match the flatbuffer length");\n\n'
+        )
+        if arena_size is not None:
+            header += (
+                '// Tensor arena for the TFLM interpreter (planned activations, tensors\n'
+                '// with disjoint lifetimes sharing bytes, + 10% headroom)\n'
+                f'const unsigned int lpr_model_arena_size = {arena_size};\n\n'
+            )
+        header += '#endif // LPR_MODEL_H\n'
+        
+        # Single write instead of one per line
+        with open(output_path, 'w') as f:
+            f.write(header)
+        
+        print(f"C array saved to {output_path}")
+    
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(output_path, cache_path)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Create, convert and export the ESP32-CAM LPR model")
+    parser.add_argument('--eon', action='store_true',
+                        help="emit EON-style C++ (direct kernel calls) instead of a C array")
+    parser.add_argument('--force-reconvert', action='store_true',
+                        help="ignore cached .tflite/.h artifacts in .cache/lpr/")
+    parser.add_argument('--convert-only', metavar='TFLITE_PATH',
+                        help="only convert an existing .tflite to a C header "
+                             "(skips TensorFlow and model setup)")
+    parser.add_argument('--input-size', type=int, default=INPUT_SHAPE[0],
+                        help="square grayscale input resolution (default: %(default)s)")
+    parser.add_argument('--alpha', type=float, default=WIDTH_MULTIPLIER,
+                        help="width multiplier for conv filter counts (default: %(default)s)")
+    parser.add_argument('--epochs', type=int, default=EPOCHS,
+                        help="training epochs when images are found in "
+                             f"{DATASET_DIR}/training (default: %(default)s)")
+    parser.add_argument('--sweep', action='store_true',
+                        help="export every input size in %s x alpha in %s"
+                             % (SWEEP_INPUT_SIZES, SWEEP_WIDTH_MULTIPLIERS))
+    return parser.parse_args(argv)
+
+def export_model(model, input_shape, name, eon=False, force_reconvert=False, epochs=EPOCHS):
+    """
+    Train (or initialize) model, fold BatchNorm, quantize and write
+    <name>.tflite and <name>.h
+    Returns (tflite_model, trained) where trained says whether real
+    images from DATASET_DIR were used
+    """
+    import tensorflow as tf
+    from tensorflow import keras
     
     # Compile model
     model.compile(
@@ -119,37 +1200,160 @@ def main():
         metrics=['accuracy']
     )
     
+    train_dir = pathlib.Path(DATASET_DIR) / 'training'
+    trained = _has_images(train_dir)
+    if trained:
+        print(f"\nTraining on images from {train_dir}...")
+        
+        dataset = build_dataset(train_dir, input_shape=input_shape)
+        model, callbacks = prune_model(model, num_steps=epochs * int(dataset.cardinality()))
+        model.fit(dataset, epochs=epochs, verbose=2, callbacks=callbacks)
+        
+        # Calibrate PTQ on un-augmented training images
+        representative_data = build_calibration_dataset(train_dir, input_shape=input_shape)
+        
+        # Verify on the testing split when there is one
+        test_dir = pathlib.Path(DATASET_DIR) / 'testing'
+        held_out = build_dataset(test_dir if _has_images(test_dir) else train_dir,
+                                 batch_size=16, training=False, input_shape=input_shape)
+        verify_data = next(iter(held_out))[0].numpy()
+    else:
+        # Example: Create and convert a dummy trained model
+        print("\nCreating example model (untrained)...")
+        
+        # Generate some dummy data for model initialization
+        # (created as TF tensors so it never round-trips through numpy)
+        dummy_data = tf.random.uniform((10,) + tuple(input_shape), minval=-1.0, maxval=1.0,
+                                       dtype=tf.float32)
+        dummy_labels = tf.random.uniform((10,), minval=0, maxval=NUM_CLASSES, dtype=tf.int32)
+        
+        # A couple of training steps are enough to initialize weights (and
+        # let pruning reach its final sparsity). Compile the step with XLA
+        # for the fixed input shape (fuses conv -> BN -> ReLU6), and drive
+        # the pruning callbacks by hand since there is no fit() loop
+        model, callbacks = prune_model(model, num_steps=INIT_STEPS)
+        loss_fn = keras.losses.SparseCategoricalCrossentropy()
+        optimizer = keras.optimizers.Adam()
+        
+        @tf.function(jit_compile=True)
+        def train_step(x, y):
+            with tf.GradientTape() as tape:
+                loss = loss_fn(y, model(x, training=True))
+            grads = tape.gradient(loss, model.trainable_variables)
+            optimizer.apply_gradients(zip(grads, model.trainable_variables))
+            return loss
+        
+        for callback in callbacks:
+            callback.set_model(model)
+            callback.on_train_begin()
+        for step in range(INIT_STEPS):
+            for callback in callbacks:
+                callback.on_train_batch_begin(step)
+            train_step(dummy_data, dummy_labels)
+        for callback in callbacks:
+            callback.on_epoch_end(0)
+        
+        # Calibrate on the first samples, check on the rest
+        representative_data = dummy_data[:8]
+        verify_data = dummy_data[8:].numpy()
+    
+    # Drop pruning wrappers, then merge BatchNorm into the preceding convs
+    model = strip_pruning(model)
+    model = fold_batchnorm(model)
+    
+    # Convert to TFLite
+    tflite_model = convert_to_tflite(model, f'{name}.tflite',
+                                     representative_data=representative_data,
+                                     force=force_reconvert)
+    
+    # Verification (TFLite interpreter) and C array generation only need the
+    # converted model, so run them side by side
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        verify = executor.submit(verify_tflite_model, tflite_model, model, verify_data)
+        export = executor.submit(tflite_to_c_array, f'{name}.tflite', f'{name}.h',
+                                 eon=eon, force=force_reconvert)
+        verify.result()
+        export.result()
+    
+    return tflite_model, trained
+
+def sweep(eon=False, force_reconvert=False, epochs=EPOCHS):
+    """
+    Export one model per input size x width multiplier and print the
+    flash / arena footprint of each, to pick a resolution per device
+    The arena column is the planned TFLM arena (lpr_model_arena_size),
+    comparable to the kTensorArenaSize reserved by the firmware
+    """
+    results = []
+    for size in SWEEP_INPUT_SIZES:
+        for alpha in SWEEP_WIDTH_MULTIPLIERS:
+            print(f"\n--- {size}x{size}, alpha={alpha} ---")
+            input_shape = (size, size, 1)
+            model = create_lightweight_model(input_shape, NUM_CLASSES, width_multiplier=alpha)
+            tflite_model, _ = export_model(model, input_shape, f'lpr_model_{size}_{alpha}',
+                                           eon=eon, force_reconvert=force_reconvert,
+                                           epochs=epochs)
+            results.append((size, alpha, len(tflite_model), _arena_size_estimate(tflite_model)))
+    
+    print("\n" + "="*60)
+    print("SWEEP RESULTS")
+    print("="*60)
+    print(f"{'input':>8} {'alpha':>6} {'model KB':>10} {'arena KB':>10}")
+    for size, alpha, model_bytes, arena_bytes in results:
+        arena = f"{arena_bytes / 1024:.1f}" if arena_bytes is not None else "n/a"
+        print(f"{size:>8} {alpha:>6} {model_bytes / 1024:>10.1f} {arena:>10}")
+    if any(arena_bytes is None for *_, arena_bytes in results):
+        print("(pip install tflite for arena size estimates)")
+    else:
+        print("(arena = planned activations + 10% interpreter headroom)")
+    print("="*60)
+
+def main(eon=False, force_reconvert=False, input_size=INPUT_SHAPE[0],
+         width_multiplier=WIDTH_MULTIPLIER, run_sweep=False, epochs=EPOCHS):
+    print("Creating lightweight LPR model for ESP32-CAM...")
+    
+    if not run_sweep:
+        # Create model
+        input_shape = (input_size, input_size, 1)
+        model = create_lightweight_model(input_shape, NUM_CLASSES,
+                                         width_multiplier=width_multiplier)
+        
+        # Display model summary
+        model.summary()
+    
     print("\n" + "="*60)
     print("MODEL CREATED - Next Steps:")
     print("="*60)
     print("1. Collect and label your license plate dataset")
-    print("2. Train the model using model.fit(X_train, y_train, ...)")
-    print("3. Run convert_to_tflite(model) to create .tflite file")
-    print("4. Run tflite_to_c_array('lpr_model.tflite') to create .h file")
-    print("5. Copy the .h file to your ESP32-CAM project src/ folder")
+    print(f"2. Train the model using model.fit(build_dataset('{DATASET_DIR}/training'), ...)")
+    print("   (optionally wrapped with prune_model() and stripped with strip_pruning())")
+    print("3. Run model = fold_batchnorm(model) to merge BatchNorm into convs")
+    print("4. Run convert_to_tflite(model, representative_data=build_calibration_dataset(...))")
+    print("5. Run tflite_to_c_array('lpr_model.tflite') to create .h file")
+    print("6. Copy the .h file to your ESP32-CAM project src/ folder")
     print("\nAlternatively, use Edge Impulse for easier workflow:")
     print("https://www.edgeimpulse.com/")
     print("="*60)
     
-    # Example: Create and convert a dummy trained model
-    print("\nCreating example model (untrained)...")
-    
-    # Generate some dummy data for model initialization
-    dummy_data = np.random.rand(10, 96, 96, 1).astype(np.float32)
-    dummy_labels = np.random.randint(0, 2, 10)
-    
-    # Fit for one epoch just to initialize weights
-    model.fit(dummy_data, dummy_labels, epochs=1, verbose=0)
-    
-    # Convert to TFLite
-    convert_to_tflite(model, 'lpr_model_example.tflite')
+    if run_sweep:
+        sweep(eon=eon, force_reconvert=force_reconvert, epochs=epochs)
+        return
     
-    # Convert to C array
-    tflite_to_c_array('lpr_model_example.tflite', 'lpr_model_example.h')
+    _, trained = export_model(model, input_shape, 'lpr_model_example',
+                              eon=eon, force_reconvert=force_reconvert, epochs=epochs)
     
     print("\nExample model files created!")
-    print("NOTE: This is an UNTRAINED model for demonstration only.")
-    print("You need to train with real data for actual license plate recognition.")
+    if not trained:
+        print("NOTE: This is an UNTRAINED model for demonstration only.")
+        print("You need to train with real data for actual license plate recognition.")
 
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    if args.convert_only:
+        tflite_to_c_array(args.convert_only,
+                          str(pathlib.Path(args.convert_only).with_suffix('.h')),
+                          eon=args.eon, force=args.force_reconvert)
+    else:
+        main(eon=args.eon, force_reconvert=args.force_reconvert,
+             input_size=args.input_size, width_multiplier=args.alpha,
+             run_sweep=args.sweep, epochs=args.epochs)